@@ -6,6 +6,9 @@ import re
 import pandas as pd
 import numpy as np
 
+from pollutants import POLLUTANTS, WHO_DAILY_GUIDELINES, aqi_categories, concentration_to_aqi, pollutant_key
+from sketches import DEFAULT_QUANTILES, SKETCH_KEYS, build_sketches, quantile_frame, save_table
+
 def find_column(df, candidates):
     cols = {c.lower(): c for c in df.columns}
     for cand in candidates:
@@ -13,176 +16,229 @@ def find_column(df, candidates):
             return cols[cand.lower()]
     return None
 
-def aqi_category(aqi):
-    if pd.isna(aqi):
-        return pd.NA
-    aqi = float(aqi)
-    if aqi <= 50:
-        return "Good"
-    if aqi <= 100:
-        return "Moderate"
-    if aqi <= 150:
-        return "Unhealthy for Sensitive Groups"
-    if aqi <= 200:
-        return "Unhealthy"
-    if aqi <= 300:
-        return "Very Unhealthy"
-    return "Hazardous"
-
-# fallback: derive category from PM2.5 concentration (µg/m3) using common breakpoints
-def pm25_category(pm25):
-    if pd.isna(pm25):
-        return pd.NA
-    v = float(pm25)
-    if v <= 12.0:
-        return "Good"
-    if v <= 35.4:
-        return "Moderate"
-    if v <= 55.4:
-        return "Unhealthy for Sensitive Groups"
-    if v <= 150.4:
-        return "Unhealthy"
-    if v <= 250.4:
-        return "Very Unhealthy"
-    return "Hazardous"
-
 def sanitize_sheet_name(name):
     # Excel sheet name rules: max 31 chars, cannot contain : \ / ? * [ ]
     s = re.sub(r'[:\\/\?\*\[\]]', '_', str(name))
     return s[:31]
 
-def main(csv_dir, out_file="hourly_combined.xlsx", pattern="**/*.csv"):
-    files = glob.glob(os.path.join(csv_dir, pattern), recursive=True)
-    if not files:
-        print("No CSV files found in", csv_dir); return
+def normalize_frame(df, source_name):
+    """Normalize one raw station export (any mix of pollutants) into Site/Parameter/Year/Month/Day/Hour/RawConc/AQI rows.
 
-    rows = []
-    for f in files:
+    Returns None when the frame lacks the required columns or has no valid rows.
+    """
+    # normalize column names
+    df.columns = [c.strip() for c in df.columns]
+
+    # locate columns robustly
+    col_site = find_column(df, ["Site","site","Station","station"])
+    col_param = find_column(df, ["Parameter","parameter","Pollutant"])
+    col_year = find_column(df, ["Year","year"])
+    col_month = find_column(df, ["Month","month"])
+    col_day = find_column(df, ["Day","day"])
+    col_hour = find_column(df, ["Hour","hour","Hour24","HOUR","HH"])
+    col_datetime = find_column(df, ["DateTime","Datetime","timestamp","Timestamp","Time","time"])
+    col_raw = find_column(df, ["Raw Conc.","Raw Conc","RawConc","Raw Conc","Raw_Conc","RawConc.", "PM2.5"])
+    col_aqi = find_column(df, ["AQI","Aqi","aqi"])
+    col_qc = find_column(df, ["QC Name", "QC_Name", "QC", "qc"])
+
+    if not all([col_site, col_param, col_raw]) :
+        print("Skipping (missing required cols Site/Parameter/RawConc):", source_name)
+        return None
+
+    # try to extract year/month/day/hour from datetime if missing
+    if col_datetime:
         try:
-            df = pd.read_csv(f, dtype=str)
-        except Exception as e:
-            print("Skipping", f, ":", e); continue
-        # normalize column names
-        df.columns = [c.strip() for c in df.columns]    
-
-        # locate columns robustly
-        col_site = find_column(df, ["Site","site","Station","station"])
-        col_param = find_column(df, ["Parameter","parameter","Pollutant"])
-        col_year = find_column(df, ["Year","year"])
-        col_month = find_column(df, ["Month","month"])
-        col_day = find_column(df, ["Day","day"])
-        col_hour = find_column(df, ["Hour","hour","Hour24","HOUR","HH"])
-        col_datetime = find_column(df, ["DateTime","Datetime","timestamp","Timestamp","Time","time"])
-        col_raw = find_column(df, ["Raw Conc.","Raw Conc","RawConc","Raw Conc","Raw_Conc","RawConc.", "PM2.5"])
-        col_aqi = find_column(df, ["AQI","Aqi","aqi"])
-        col_qc = find_column(df, ["QC Name", "QC_Name", "QC", "qc"])
-
-        if not all([col_site, col_param, col_raw]) :
-            print("Skipping (missing required cols Site/Parameter/RawConc):", f)
-            continue
-
-        # try to extract year/month/day/hour from datetime if missing
-        if col_datetime:
+            dt = pd.to_datetime(df[col_datetime], errors="coerce")
+            if col_year is None:
+                df["__year_tmp"] = dt.dt.year
+                col_year = "__year_tmp"
+            if col_month is None:
+                df["__month_tmp"] = dt.dt.month
+                col_month = "__month_tmp"
+            if col_day is None:
+                df["__day_tmp"] = dt.dt.day
+                col_day = "__day_tmp"
+            if col_hour is None:
+                df["__hour_tmp"] = dt.dt.hour
+                col_hour = "__hour_tmp"
+        except Exception:
+            pass
+
+    # if hour still missing, attempt to find 'Time' parts or default to 0
+    if col_hour is None:
+        # if there is a 'Time' column that looks like HH:MM
+        tcol = find_column(df, ["Time","time","Local Time","local_time"])
+        if tcol:
             try:
-                dt = pd.to_datetime(df[col_datetime], errors="coerce")
-                if col_year is None:
-                    df["__year_tmp"] = dt.dt.year
-                    col_year = "__year_tmp"
-                if col_month is None:
-                    df["__month_tmp"] = dt.dt.month
-                    col_month = "__month_tmp"
-                if col_day is None:
-                    df["__day_tmp"] = dt.dt.day
-                    col_day = "__day_tmp"
-                if col_hour is None:
-                    df["__hour_tmp"] = dt.dt.hour
-                    col_hour = "__hour_tmp"
+                tt = pd.to_datetime(df[tcol], errors="coerce")
+                df["__hour_tmp2"] = tt.dt.hour
+                col_hour = "__hour_tmp2"
             except Exception:
                 pass
 
-        # if hour still missing, attempt to find 'Time' parts or default to 0
-        if col_hour is None:
-            # if there is a 'Time' column that looks like HH:MM
-            tcol = find_column(df, ["Time","time","Local Time","local_time"])
-            if tcol:
-                try:
-                    tt = pd.to_datetime(df[tcol], errors="coerce")
-                    df["__hour_tmp2"] = tt.dt.hour
-                    col_hour = "__hour_tmp2"
-                except Exception:
-                    pass
-
-        # coerce numeric fields
-        for nc in [col_raw, col_aqi, col_year, col_month, col_day, col_hour]:
-            if nc:
-                df[nc] = pd.to_numeric(df[nc], errors="coerce")
-
-        # Apply filters:
-        mask = df[col_raw].notna() & (df[col_raw] >= 0)
-        if col_qc:
-            qc_series = df[col_qc].astype(str).str.strip()
-            mask &= qc_series.notna() & (qc_series.str.len() > 0) & (qc_series.str.lower() != "invalid")
-
-        df = df[mask].copy()
-        if df.empty:
-            continue
-
-        # ensure Year/Month/Day/Hour exist (fill with NaN -> will be dropped later)
-        if col_year is None or col_month is None or col_day is None or col_hour is None:
-            # try to infer from filename if it contains YYYY or YYYYMMDD
-            m = re.search(r'(\d{4})', os.path.basename(f))
-            if m and col_year is None:
-                df["__year_infer"] = int(m.group(1))
-                col_year = "__year_infer"
-            # set missing numeric columns to 0 where absolutely necessary
-            if col_year is None: df["__year_missing"] = pd.NA; col_year="__year_missing"
-            if col_month is None: df["__month_missing"]=pd.NA; col_month="__month_missing"
-            if col_day is None: df["__day_missing"]=pd.NA; col_day="__day_missing"
-            if col_hour is None: df["__hour_missing"]=0; col_hour="__hour_missing"
-
-        df2 = pd.DataFrame({
-            "Site": df[col_site].astype(str).str.strip(),
-            "Parameter": df[col_param].astype(str).str.strip(),
-            "Year": df[col_year].astype("Int64"),
-            "Month": df[col_month].astype("Int64"),
-            "Day": df[col_day].astype("Int64"),
-            "Hour": df[col_hour].astype("Int64"),
-            "RawConc": df[col_raw],
-            "AQI": df[col_aqi] if col_aqi else pd.NA
-        })
-        rows.append(df2)
-
-    if not rows:
-        print("No valid rows after filtering."); return
+    # coerce numeric fields
+    for nc in [col_raw, col_aqi, col_year, col_month, col_day, col_hour]:
+        if nc:
+            df[nc] = pd.to_numeric(df[nc], errors="coerce")
+
+    # Apply filters:
+    mask = df[col_raw].notna() & (df[col_raw] >= 0)
+    if col_qc:
+        qc_series = df[col_qc].astype(str).str.strip()
+        mask &= qc_series.notna() & (qc_series.str.len() > 0) & (qc_series.str.lower() != "invalid")
 
-    all_df = pd.concat(rows, ignore_index=True)
+    df = df[mask].copy()
+    if df.empty:
+        return None
+
+    # ensure Year/Month/Day/Hour exist (fill with NaN -> will be dropped later)
+    if col_year is None or col_month is None or col_day is None or col_hour is None:
+        # try to infer from filename if it contains YYYY or YYYYMMDD
+        m = re.search(r'(\d{4})', os.path.basename(source_name))
+        if m and col_year is None:
+            df["__year_infer"] = int(m.group(1))
+            col_year = "__year_infer"
+        # set missing numeric columns to 0 where absolutely necessary
+        if col_year is None: df["__year_missing"] = pd.NA; col_year="__year_missing"
+        if col_month is None: df["__month_missing"]=pd.NA; col_month="__month_missing"
+        if col_day is None: df["__day_missing"]=pd.NA; col_day="__day_missing"
+        if col_hour is None: df["__hour_missing"]=0; col_hour="__hour_missing"
+
+    df2 = pd.DataFrame({
+        "Site": df[col_site].astype(str).str.strip(),
+        "Parameter": df[col_param].astype(str).str.strip(),
+        "Year": df[col_year].astype("Int64"),
+        "Month": df[col_month].astype("Int64"),
+        "Day": df[col_day].astype("Int64"),
+        "Hour": df[col_hour].astype("Int64"),
+        "RawConc": df[col_raw],
+        "AQI": df[col_aqi] if col_aqi else np.nan
+    })
 
     # drop rows missing key date parts (Year/Month/Day) -- keep Hour 0 allowed
-    all_df = all_df[ all_df["Year"].notna() & all_df["Month"].notna() & all_df["Day"].notna() ]
-
-    # group by site/parameter/date/hour
-    group_cols = ["Site","Parameter","Year","Month","Day","Hour"]
-    agg = all_df.groupby(group_cols).agg(
-        PM25_Avg = ("RawConc","mean"),
-        AQI_Avg = ("AQI","mean"),
-        Hours = ("RawConc","count")
+    df2 = df2[ df2["Year"].notna() & df2["Month"].notna() & df2["Day"].notna() ]
+    if df2.empty:
+        return None
+    return df2
+
+GROUP_COLS = ["Site","Parameter","Year","Month","Day","Hour"]
+
+def partial_aggregate(rows_df):
+    """Reduce normalized rows to mergeable per-hour sums and counts.
+
+    Partials from different files (or workers) combine with merge_partials and
+    finalize to the same means as grouping the concatenated rows directly.
+    """
+    rows_df = rows_df.assign(AQI=pd.to_numeric(rows_df["AQI"], errors="coerce"))
+    return rows_df.groupby(GROUP_COLS).agg(
+        RawConc_Sum = ("RawConc","sum"),
+        RawConc_Count = ("RawConc","count"),
+        AQI_Sum = ("AQI","sum"),
+        AQI_Count = ("AQI","count")
     ).reset_index()
 
-    agg["PM25_Avg"] = agg["PM25_Avg"].round(2)
-    agg["AQI_Avg"] = agg["AQI_Avg"].round().astype("Int64")
+def merge_partials(partials):
+    partials = [p for p in partials if p is not None and not p.empty]
+    if not partials:
+        return None
+    if len(partials) == 1:
+        return partials[0]
+    return pd.concat(partials, ignore_index=True).groupby(GROUP_COLS, as_index=False).sum()
 
-    # Category: prefer AQI_Avg -> aqi_category; if missing, derive from PM2.5
-    def choose_category(row):
-        if pd.notna(row["AQI_Avg"]):
-            return aqi_category(row["AQI_Avg"])
-        return pm25_category(row["PM25_Avg"])
+HOUR_COLS = ["Site","Year","Month","Day","Hour"]
+LAYOUTS = ("legacy", "long", "wide")
 
-    agg["Category"] = agg.apply(choose_category, axis=1)
+def finalize(partial, layout="legacy"):
+    """Turn merged per-hour partials into the report for every pollutant at once.
 
-    # final columns order: Site, Parameter, Year, Month, Day, Hour, PM2.5, Category
-    final = agg[["Site","Parameter","Year","Month","Day","Hour","PM25_Avg","Category","Hours"]]
-    final = final.rename(columns={"PM25_Avg":"PM2.5 (avg)","Hours":"Observations"})
+    legacy: the original hourly report read by the map/slider frontend, one row
+          per Site/Parameter/hour: "PM2.5 (avg)", Category, Observations. The
+          value column keeps that name whatever the parameter.
+    long: one row per Site/Parameter/hour with "Conc (avg)", AQI, Category and
+          the hour's "Overall AQI" (max over pollutants) and "Overall Category".
+    wide: one row per Site/hour with "<pollutant> (avg)" and "<pollutant> AQI"
+          columns, the overall AQI, its Category and the Dominant Pollutant.
+    AQI is the reported AQI average where present, otherwise it is computed from
+    the concentration with the pollutant's breakpoint table.
+    """
+    labels = partial["Parameter"].unique()
+    partial = partial.assign(Pollutant=partial["Parameter"].map({l: pollutant_key(l) for l in labels}))
+    if layout == "wide":
+        # several Parameter labels (e.g. PM2.5 - Principal / Non Principal) fold into one pollutant column
+        sum_cols = ["RawConc_Sum","RawConc_Count","AQI_Sum","AQI_Count"]
+        partial = partial.groupby(["Site","Pollutant","Year","Month","Day","Hour"], as_index=False)[sum_cols].sum()
 
+    agg = partial.drop(columns=["RawConc_Sum","RawConc_Count","AQI_Sum","AQI_Count"])
+    agg["Conc (avg)"] = (partial["RawConc_Sum"] / partial["RawConc_Count"]).round(2)
+    aqi = (partial["AQI_Sum"] / partial["AQI_Count"].where(partial["AQI_Count"] > 0)).to_numpy(dtype=float, copy=True)
+    for pol, pos in agg.groupby("Pollutant").indices.items():
+        missing = pos[np.isnan(aqi[pos])]
+        if len(missing):
+            aqi[missing] = concentration_to_aqi(pol, agg["Conc (avg)"].to_numpy()[missing])
+    agg["AQI"] = pd.Series(np.round(aqi), index=agg.index).astype("Int64")
+    agg["Observations"] = partial["RawConc_Count"]
+
+    if layout == "legacy":
+        agg["Category"] = aqi_categories(agg["AQI"])
+        final = agg[["Site","Parameter","Year","Month","Day","Hour","Conc (avg)","Category","Observations"]]
+        return final.rename(columns={"Conc (avg)":"PM2.5 (avg)"})
+
+    if layout == "long":
+        agg["Category"] = aqi_categories(agg["AQI"])
+        agg["Overall AQI"] = agg.groupby(HOUR_COLS)["AQI"].transform("max")
+        agg["Overall Category"] = aqi_categories(agg["Overall AQI"])
+        return agg[["Site","Parameter","Pollutant","Year","Month","Day","Hour","Conc (avg)","AQI","Category",
+                    "Observations","Overall AQI","Overall Category"]]
+
+    # pivot plain floats: a nullable Int64 AQI with NA (e.g. O3 under 125 ppb) cannot go through astype(float)
+    floats = agg.assign(AQI=agg["AQI"].astype("Float64").to_numpy(dtype=float, na_value=np.nan))
+    wide = floats.pivot(index=HOUR_COLS, columns="Pollutant", values=["Conc (avg)","AQI"])
+    present = list(wide.columns.get_level_values(1).unique())
+    order = [p for p in POLLUTANTS if p in present] + sorted(p for p in present if p not in POLLUTANTS)
+    aqi_wide = wide["AQI"][order].astype(float)
+    out = pd.DataFrame(index=wide.index)
+    for pol in order:
+        out[f"{pol} (avg)"] = wide["Conc (avg)"][pol].astype(float)
+        out[f"{pol} AQI"] = wide["AQI"][pol].astype("Int64")
+    has_aqi = aqi_wide.notna().any(axis=1)
+    out["AQI"] = aqi_wide.max(axis=1).round().astype("Int64")
+    out["Category"] = aqi_categories(out["AQI"])
+    out["Dominant Pollutant"] = aqi_wide.fillna(-1).idxmax(axis=1).where(has_aqi)
+    return out.reset_index()
+
+def daily_exceedances(partial):
+    """Days with data and days whose daily mean exceeds the WHO 24-hour guideline, per site-month."""
+    labels = partial["Parameter"].unique()
+    daily = partial.assign(Pollutant=partial["Parameter"].map({l: pollutant_key(l) for l in labels}))
+    daily = daily.groupby(["Site","Pollutant","Year","Month","Day"], as_index=False)[["RawConc_Sum","RawConc_Count"]].sum()
+    guideline = daily["Pollutant"].map(WHO_DAILY_GUIDELINES)
+    daily["Above"] = (daily["RawConc_Sum"] / daily["RawConc_Count"] > guideline).where(guideline.notna())
+    out = daily.groupby(SKETCH_KEYS, as_index=False).agg(Days=("Day","count"), DaysAbove=("Above","sum"))
+    out["Days Above WHO"] = out["DaysAbove"].where(out["Pollutant"].isin(list(WHO_DAILY_GUIDELINES))).astype("Int64")
+    out["WHO Guideline"] = out["Pollutant"].map(WHO_DAILY_GUIDELINES)
+    return out.drop(columns=["DaysAbove"])
+
+def distribution_summary(partial, sketches, quantiles=DEFAULT_QUANTILES):
+    """Per site-month quantiles of hourly mean concentrations (from sketches) plus WHO exceedance days."""
+    quant = quantile_frame(sketches, SKETCH_KEYS, quantiles)
+    quant["Year"] = quant["Year"].astype("Int64")
+    quant["Month"] = quant["Month"].astype("Int64")
+    exceed = daily_exceedances(partial)
+    exceed["Year"] = exceed["Year"].astype("Int64")
+    exceed["Month"] = exceed["Month"].astype("Int64")
+    return quant.merge(exceed, on=SKETCH_KEYS, how="left")
+
+def write_summaries(partial, summary_out=None, sketch_out=None):
+    sketches = build_sketches(partial)
+    if sketch_out:
+        save_table(sketches, sketch_out)
+        print("Wrote sketches:", sketch_out, "groups:", len(sketches))
+    if summary_out:
+        summary = distribution_summary(partial, sketches)
+        summary.to_csv(summary_out, index=False)
+        print("Wrote summary:", summary_out, "rows:", len(summary))
+
+def write_output(final, out_file):
     # write to Excel with sheets per Site_Year (e.g. HCMC_2023)
     out_lower = str(out_file).lower()
     if out_lower.endswith(".xlsx") or out_lower.endswith(".xls"):
@@ -199,10 +255,36 @@ def main(csv_dir, out_file="hourly_combined.xlsx", pattern="**/*.csv"):
         final.to_csv(out_file, index=False)
         print("Wrote CSV:", out_file, "rows:", len(final))
 
+def main(csv_dir, out_file="hourly_combined.xlsx", pattern="**/*.csv", layout="legacy", summary_out=None, sketch_out=None):
+    files = glob.glob(os.path.join(csv_dir, pattern), recursive=True)
+    if not files:
+        print("No CSV files found in", csv_dir); return
+
+    partials = []
+    for f in files:
+        try:
+            df = pd.read_csv(f, dtype=str)
+        except Exception as e:
+            print("Skipping", f, ":", e); continue
+        rows_df = normalize_frame(df, f)
+        if rows_df is not None:
+            partials.append(partial_aggregate(rows_df))
+
+    partial = merge_partials(partials)
+    if partial is None:
+        print("No valid rows after filtering."); return
+
+    write_output(finalize(partial, layout), out_file)
+    if summary_out or sketch_out:
+        write_summaries(partial, summary_out, sketch_out)
+
 if __name__ == "__main__":
-    p = argparse.ArgumentParser(description="Combine CSVs into hourly report (Site,Parameter,Year,Month,Day,Hour,PM2.5,Category).")
+    p = argparse.ArgumentParser(description="Combine CSVs into hourly report (Site,Parameter,Year,Month,Day,Hour,PM2.5,Category); --layout long/wide add per-pollutant AQI.")
     p.add_argument("--csv-dir", required=True, help="Directory to search for CSV files (recursive).")
     p.add_argument("--out-file", default="hourly_combined.xlsx", help="Output Excel (.xlsx) or CSV path.")
+    p.add_argument("--layout", choices=LAYOUTS, default="legacy", help="legacy: original PM2.5 (avg)/Category/Observations report; long: one row per site/parameter/hour with AQI and overall AQI; wide: one row per site/hour with a column per pollutant (default legacy).")
+    p.add_argument("--summary-out", help="Also write per site-month p50/p95/p99 and WHO exceedance days (CSV).")
+    p.add_argument("--sketch-out", help="Also write mergeable per site-month quantile sketches (CSV, see sketches.py).")
     args = p.parse_args()
-    main(args.csv_dir, args.out_file)
+    main(args.csv_dir, args.out_file, layout=args.layout, summary_out=args.summary_out, sketch_out=args.sketch_out)
 # ...existing code...
\ No newline at end of file
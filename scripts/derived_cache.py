@@ -0,0 +1,237 @@
+"""
+Content-addressed on-disk cache for derived results (monthly means, climatology, pivots).
+
+Entries are keyed by the SHA-256 of the input files' contents, the parameters
+that shaped the result, a per-kind schema version and the pandas/numpy versions,
+so editing an input, changing a parameter, changing the computation (bump its
+version) or upgrading pandas yields a new key and stale entries simply age out.
+Entries that fail to load for any reason are treated as misses and deleted.
+A None result (e.g. an input with no valid rows) is cached too, so unchanged
+invalid inputs are not re-read on every run.
+The cache directory is kept under a size budget by evicting least-recently-used
+entries (access time is tracked through the entry file's mtime).
+
+Usage from a script:
+  cache = DerivedCache.from_args(args)
+  monthly = cache.cached("predict.monthly", MONTHLY_CACHE_VERSION, [csv_path], {"value_col": args.value_col}, compute)
+  cache.report()
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.environ.get("AIRG_CACHE_DIR", ".airg_cache")
+DEFAULT_MAX_MB = 256
+DIGEST_INDEX = "digests.json"
+ENTRY_SUFFIX = ".pkl"
+# stored in place of a None result, which get() cannot tell apart from a miss
+NO_RESULT = "<derived_cache: no result>"
+
+
+def add_cache_arguments(parser):
+    """Add --no-cache, --cache-dir and --cache-max-mb to an argparse parser."""
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the derived-results cache (neither read nor write).")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Derived-results cache directory (default {DEFAULT_CACHE_DIR}, env AIRG_CACHE_DIR).")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_MB, help=f"Cache size budget in MB, LRU-evicted (default {DEFAULT_MAX_MB}).")
+
+
+class DerivedCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_MB * 1024 * 1024, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._digests = None
+        if enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.cache_dir, args.cache_max_mb * 1024 * 1024, enabled=not args.no_cache)
+
+    # ---- keys ---------------------------------------------------------------
+
+    def _load_digest_index(self):
+        if self._digests is None:
+            path = os.path.join(self.cache_dir, DIGEST_INDEX)
+            try:
+                with open(path, "r", encoding="utf-8") as fh:
+                    self._digests = json.load(fh)
+            except (OSError, ValueError):
+                self._digests = {}
+        return self._digests
+
+    def file_digest(self, path):
+        """SHA-256 of a file's contents, memoized on (path, size, mtime)."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        index = self._load_digest_index() if self.enabled else {}
+        memo = index.get(path)
+        if memo and memo[:2] == stamp:
+            return memo[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        if self.enabled:
+            index[path] = stamp + [digest]
+            # forget inputs that have since been deleted or renamed
+            for old in [p for p in index if not os.path.exists(p)]:
+                del index[old]
+            self._atomic_write(os.path.join(self.cache_dir, DIGEST_INDEX), json.dumps(index).encode("utf-8"))
+        return digest
+
+    def key(self, kind, version, input_paths, params):
+        payload = {
+            "kind": kind,
+            "version": version,
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "inputs": [self.file_digest(p) for p in input_paths],
+            "params": params,
+        }
+        blob = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha256(blob).hexdigest()
+
+    # ---- entries ------------------------------------------------------------
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+    def _atomic_write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def get(self, key):
+        """Return the cached object for key, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as fh:
+                value = pickle.load(fh)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # truncated, corrupt or written by incompatible library versions
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # mark as most recently used
+        now = time.time()
+        os.utime(path, (now, now))
+        return value
+
+    def put(self, key, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        self._atomic_write(self._entry_path(key), data)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Drop least-recently-used entries until the cache fits its size budget."""
+        entries = []
+        total = 0
+        for de in os.scandir(self.cache_dir):
+            if de.is_file() and de.name.endswith(ENTRY_SUFFIX):
+                st = de.stat()
+                entries.append((st.st_mtime, st.st_size, de.path))
+                total += st.st_size
+        entries.sort()
+        keep_path = self._entry_path(keep) if keep else None
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep_path:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def cached(self, kind, version, input_paths, params, compute):
+        """Return compute() memoized under (kind, version, input contents, params).
+
+        Bump `version` whenever the code behind `compute` changes its result.
+        """
+        if not self.enabled:
+            return compute()
+        key = self.key(kind, version, input_paths, params)
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return None if isinstance(value, str) and value == NO_RESULT else value
+        self.misses += 1
+        value = compute()
+        self.put(key, NO_RESULT if value is None else value)
+        return value
+
+    # ---- reporting ----------------------------------------------------------
+
+    def usage(self):
+        count = 0
+        total = 0
+        if self.enabled and os.path.isdir(self.cache_dir):
+            for de in os.scandir(self.cache_dir):
+                if de.is_file() and de.name.endswith(ENTRY_SUFFIX):
+                    count += 1
+                    total += de.stat().st_size
+        return count, total
+
+    def report(self, file=sys.stderr):
+        if not self.enabled:
+            print("cache: disabled (--no-cache)", file=file)
+            return
+        count, total = self.usage()
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        print(f"cache: hits={self.hits} misses={self.misses} hit_rate={rate:.0f}% "
+              f"evictions={self.evictions} entries={count} size={total / 1e6:.2f}MB dir={self.cache_dir}", file=file)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Inspect or clear the derived-results cache.")
+    p.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help=f"Cache directory (default {DEFAULT_CACHE_DIR}).")
+    p.add_argument("--clear", action="store_true", help="Remove all cached entries and the input digest index.")
+    args = p.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"No cache at {args.cache_dir}")
+        return
+    cache = DerivedCache(args.cache_dir)
+    if args.clear:
+        cache.max_bytes = 0
+        cache.evict()
+        index = os.path.join(args.cache_dir, DIGEST_INDEX)
+        if os.path.exists(index):
+            os.remove(index)
+        print(f"Removed {cache.evictions} entries from {args.cache_dir}")
+        return
+    count, total = cache.usage()
+    print(f"{args.cache_dir}: entries={count} size={total / 1e6:.2f}MB")
+
+
+if __name__ == "__main__":
+    main()
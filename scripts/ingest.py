@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Concurrent, resumable ingestion of raw station exports into the hourly report.
+
+Sources may be a local directory or an HTTP mirror directory listing (e.g. the
+index page served by `python -m http.server`); both are searched recursively,
+following subdirectory links below the given URL. Inputs can be plain .csv,
+gzip (.csv.gz / .gz) or .zip archives of CSVs; compression is detected from the
+file contents, not only the extension.
+
+Worker threads fetch, decompress, parse and pre-aggregate each source and hand
+the per-hour partial sums to a bounded queue; the main thread merges them and
+periodically checkpoints, so an interrupted run resumes with the sources that
+were not yet merged. The checkpoint records the --source and each merged file's
+size/mtime (or ETag/Last-Modified over HTTP); it is discarded when either no
+longer matches, or when it cannot be read back, so a different or updated
+source is always read in full.
+
+The output is the same as combine_daily.py; --summary-out/--sketch-out build
+the per site-month quantile sketches from the final merged partial, so nothing
+beyond the partial needs to be checkpointed.
+
+Usage:
+  python ingest.py --source ./raw --out-file hourly_combined.csv
+  python ingest.py --source http://localhost:8000/ --workers 8 --queue-size 4 --checkpoint-dir .ingest_ckpt
+"""
+import argparse
+import glob
+import gzip
+import io
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zipfile
+
+import pandas as pd
+
+from combine_daily import LAYOUTS, finalize, merge_partials, normalize_frame, partial_aggregate, write_output, write_summaries
+
+SOURCE_SUFFIXES = (".csv", ".csv.gz", ".gz", ".zip")
+STATE_FILE = "state.json"
+_SENTINEL = object()
+
+
+def is_url(source):
+    return urllib.parse.urlparse(str(source)).scheme in ("http", "https")
+
+
+def source_id(source):
+    return source if is_url(source) else os.path.abspath(source)
+
+
+def _walk_listing(root, url, found, seen):
+    if url in seen:
+        return
+    seen.add(url)
+    with urllib.request.urlopen(url) as resp:
+        listing = resp.read().decode("utf-8", errors="replace")
+    names = re.findall(r'href="([^"?#]+)"', listing, flags=re.IGNORECASE)
+    if not names:
+        # plain-text manifest: one file name per line
+        names = [ln.strip() for ln in listing.splitlines() if ln.strip()]
+    for n in names:
+        target = urllib.parse.urljoin(url, n)
+        # skip parent/sibling links and other hosts
+        if not target.startswith(root) or target == url:
+            continue
+        if target.endswith("/"):
+            _walk_listing(root, target, found, seen)
+            continue
+        name = urllib.parse.unquote(target[len(root):])
+        if name.lower().endswith(SOURCE_SUFFIXES):
+            found[name] = target
+
+
+def list_sources(source):
+    """Return sorted (name, location) pairs for every ingestible file under source."""
+    if is_url(source):
+        base = source if source.endswith("/") else source + "/"
+        found = {}
+        _walk_listing(base, base, found, set())
+        return sorted(found.items())
+
+    files = []
+    for suffix in SOURCE_SUFFIXES:
+        files.extend(glob.glob(os.path.join(source, "**", "*" + suffix), recursive=True))
+    return sorted((os.path.relpath(f, source), f) for f in set(files))
+
+
+def source_stamp(location, headers=None):
+    """Identity of a source's current contents: [size, mtime_ns] locally, [ETag, Last-Modified, length] over HTTP."""
+    if is_url(location):
+        if headers is None:
+            with urllib.request.urlopen(urllib.request.Request(location, method="HEAD")) as resp:
+                headers = resp.headers
+        return [headers.get("ETag"), headers.get("Last-Modified"), headers.get("Content-Length")]
+    st = os.stat(location)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def fetch_bytes(location):
+    """Return (data, stamp) for a local path or URL."""
+    if is_url(location):
+        with urllib.request.urlopen(location) as resp:
+            return resp.read(), source_stamp(location, resp.headers)
+    stamp = source_stamp(location)
+    with open(location, "rb") as fh:
+        return fh.read(), stamp
+
+
+def iter_csv_payloads(name, data):
+    """Yield (member_name, csv_bytes), transparently unpacking gzip and zip."""
+    if data[:2] == b"\x1f\x8b":
+        inner = re.sub(r"\.gz$", "", name, flags=re.IGNORECASE)
+        yield from iter_csv_payloads(inner, gzip.decompress(data))
+    elif data[:4] == b"PK\x03\x04":
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            for member in sorted(zf.namelist()):
+                if member.lower().endswith(".csv") and not member.endswith("/"):
+                    yield f"{name}::{member}", zf.read(member)
+    else:
+        yield name, data
+
+
+def load_source(name, location):
+    """Fetch one source and reduce it to (partial, raw_rows, nbytes, stamp)."""
+    data, stamp = fetch_bytes(location)
+    partials = []
+    raw_rows = 0
+    for member, payload in iter_csv_payloads(name, data):
+        try:
+            df = pd.read_csv(io.BytesIO(payload), dtype=str)
+        except Exception as e:
+            print("Skipping", member, ":", e); continue
+        raw_rows += len(df)
+        rows_df = normalize_frame(df, member)
+        if rows_df is not None:
+            partials.append(partial_aggregate(rows_df))
+    return merge_partials(partials), raw_rows, len(data), stamp
+
+
+class IngestMetrics:
+    """Thread-safe throughput and queue-depth counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.sources = 0
+        self.failed = 0
+        self.rows = 0
+        self.bytes = 0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+
+    def record_source(self, rows, nbytes):
+        with self._lock:
+            self.sources += 1
+            self.rows += rows
+            self.bytes += nbytes
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def sample_depth(self, depth):
+        with self._lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.depth_max = max(self.depth_max, depth)
+
+    def summary(self):
+        with self._lock:
+            elapsed = max(time.perf_counter() - self.started, 1e-9)
+            mean_depth = self.depth_total / self.depth_samples if self.depth_samples else 0.0
+            return (f"sources={self.sources} failed={self.failed} rows={self.rows} "
+                    f"elapsed={elapsed:.2f}s rows/s={self.rows / elapsed:,.0f} "
+                    f"MB/s={self.bytes / elapsed / 1e6:.2f} "
+                    f"queue_depth(mean={mean_depth:.2f}, max={self.depth_max})")
+
+
+def load_checkpoint(checkpoint_dir, source, sources):
+    """Return (done, partial, seq) from a previous interrupted run, if any.
+
+    done maps each merged source name to its stamp. A checkpoint that cannot be
+    read, was written for another --source, or whose merged files have since
+    changed or disappeared, is cleared.
+    """
+    state_path = os.path.join(checkpoint_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return {}, None, 0
+    try:
+        with open(state_path, "r", encoding="utf-8") as fh:
+            state = json.load(fh)
+    except (OSError, ValueError) as e:
+        print(f"Checkpoint in {checkpoint_dir} is unreadable ({e}); starting over")
+        clear_checkpoint(checkpoint_dir)
+        return {}, None, 0
+    if not isinstance(state, dict) or not isinstance(state.get("done"), dict):
+        print(f"Checkpoint in {checkpoint_dir} is malformed; starting over")
+        clear_checkpoint(checkpoint_dir)
+        return {}, None, 0
+    if state.get("source") != source_id(source):
+        print(f"Checkpoint in {checkpoint_dir} is for a different source; starting over")
+        clear_checkpoint(checkpoint_dir)
+        return {}, None, 0
+    done = state["done"]
+    locations = dict(sources)
+    for name, stamp in done.items():
+        if name not in locations or source_stamp(locations[name]) != stamp:
+            print(f"Source {name} changed since the checkpoint; starting over")
+            clear_checkpoint(checkpoint_dir)
+            return {}, None, 0
+    partial = None
+    if state.get("partial"):
+        try:
+            partial = pd.read_csv(os.path.join(checkpoint_dir, state["partial"]),
+                                  dtype={"Site": str, "Parameter": str})
+        except (OSError, ValueError) as e:
+            print(f"Checkpoint partial {state['partial']} is unreadable ({e}); starting over")
+            clear_checkpoint(checkpoint_dir)
+            return {}, None, 0
+    return done, partial, state.get("seq", 0)
+
+
+def _replace_with(path, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def save_checkpoint(checkpoint_dir, source, done, partial, seq):
+    """Write the merged partial, then atomically point state.json at it."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    partial_name = None
+    if partial is not None:
+        partial_name = f"partial-{seq:05d}.csv"
+        _replace_with(os.path.join(checkpoint_dir, partial_name), lambda p: partial.to_csv(p, index=False))
+    state = {"source": source_id(source), "seq": seq, "done": done, "partial": partial_name}
+    state_path = os.path.join(checkpoint_dir, STATE_FILE)
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(state, fh, sort_keys=True)
+    os.replace(tmp_path, state_path)
+    # older files are no longer referenced by state.json
+    for old in glob.glob(os.path.join(checkpoint_dir, "partial-*.csv")):
+        if os.path.basename(old) != partial_name:
+            os.remove(old)
+
+
+def clear_checkpoint(checkpoint_dir):
+    for path in glob.glob(os.path.join(checkpoint_dir, "partial-*.csv")) + [os.path.join(checkpoint_dir, STATE_FILE)]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _worker(todo, results, metrics):
+    while True:
+        try:
+            name, location = todo.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            partial, rows, nbytes, stamp = load_source(name, location)
+        except Exception as e:
+            print("Skipping", name, ":", e, file=sys.stderr)
+            metrics.record_failure()
+            continue
+        metrics.record_source(rows, nbytes)
+        # blocks while the consumer is behind, bounding memory held by parsed sources
+        results.put((name, stamp, partial))
+        metrics.sample_depth(results.qsize())
+    results.put(_SENTINEL)
+
+
+def ingest(source, checkpoint_dir=".ingest_checkpoint", workers=4, queue_size=8, checkpoint_every=10):
+    """Ingest every source under `source`.
+
+    Returns (partial, complete) where partial is the merged per-hour partial and
+    complete is False if any source failed and should be retried on resume.
+    """
+    sources = list_sources(source)
+    if not sources:
+        print("No input files found in", source)
+        return None, True
+
+    done, partial, seq = load_checkpoint(checkpoint_dir, source, sources)
+    pending = [(n, loc) for n, loc in sources if n not in done]
+    if done:
+        print(f"Resuming: {len(done)} of {len(sources)} sources already ingested")
+
+    todo = queue.Queue()
+    for item in pending:
+        todo.put(item)
+    results = queue.Queue(maxsize=max(1, queue_size))
+    metrics = IngestMetrics()
+
+    n_workers = max(1, min(workers, len(pending))) if pending else 0
+    threads = [threading.Thread(target=_worker, args=(todo, results, metrics), daemon=True)
+               for _ in range(n_workers)]
+    for t in threads:
+        t.start()
+
+    buffered = []
+    finished = 0
+    while finished < n_workers:
+        item = results.get()
+        metrics.sample_depth(results.qsize())
+        if item is _SENTINEL:
+            finished += 1
+            continue
+        name, stamp, part = item
+        buffered.append(part)
+        done[name] = stamp
+        if len(buffered) >= checkpoint_every:
+            partial = merge_partials([partial] + buffered)
+            buffered = []
+            seq += 1
+            save_checkpoint(checkpoint_dir, source, done, partial, seq)
+            print(f"[ingest] {len(done)}/{len(sources)} {metrics.summary()}")
+
+    for t in threads:
+        t.join()
+    partial = merge_partials([partial] + buffered)
+    if buffered:
+        save_checkpoint(checkpoint_dir, source, done, partial, seq + 1)
+    print(f"[ingest] done {metrics.summary()}")
+    return partial, len(done) == len(sources)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Concurrently ingest raw station exports (csv/gz/zip, local or HTTP) into the hourly report.")
+    p.add_argument("--source", required=True, help="Local directory or HTTP(S) URL of a mirror directory listing (both searched recursively).")
+    p.add_argument("--out-file", default="hourly_combined.xlsx", help="Output Excel (.xlsx) or CSV path.")
+    p.add_argument("--layout", choices=LAYOUTS, default="legacy", help="Output layout, see combine_daily.py (default legacy).")
+    p.add_argument("--workers", type=int, default=4, help="Number of fetch/parse worker threads (default 4).")
+    p.add_argument("--queue-size", type=int, default=8, help="Max parsed sources waiting to be merged (default 8).")
+    p.add_argument("--checkpoint-dir", default=".ingest_checkpoint", help="Directory for resume state (default .ingest_checkpoint).")
+    p.add_argument("--checkpoint-every", type=int, default=10, help="Checkpoint after this many merged sources (default 10).")
+    p.add_argument("--keep-checkpoint", action="store_true", help="Keep checkpoint files after a successful run.")
+    p.add_argument("--summary-out", help="Also write per site-month p50/p95/p99 and WHO exceedance days (CSV).")
+    p.add_argument("--sketch-out", help="Also write mergeable per site-month quantile sketches (CSV, see sketches.py).")
+    args = p.parse_args()
+
+    partial, complete = ingest(args.source, args.checkpoint_dir, args.workers, args.queue_size, args.checkpoint_every)
+    if partial is None:
+        print("No valid rows after filtering."); return
+
+    write_output(finalize(partial, args.layout), args.out_file)
+    if args.summary_out or args.sketch_out:
+        write_summaries(partial, args.summary_out, args.sketch_out)
+    if not complete:
+        print("Some sources failed; output is incomplete. Rerun to retry them from", args.checkpoint_dir, file=sys.stderr)
+        sys.exit(1)
+    if not args.keep_checkpoint:
+        clear_checkpoint(args.checkpoint_dir)
+
+
+if __name__ == "__main__":
+    main()
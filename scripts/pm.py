@@ -1,17 +1,27 @@
 # ...existing code...
 #!/usr/bin/env python3
 """
-Aggregate PM2.5 CSV files and produce monthly average PM2.5 for each Year+Month per city.
+Aggregate PM2.5 (or another pollutant, see --pollutant) CSV files and produce the
+monthly average for each Year+Month per city.
 
 Output columns:
   Month (YYYY-MM),
   Year,
   Month_num (1-12),
-  PM2.5 (monthly mean rounded to 2 decimals),
+  PM2.5 (monthly mean rounded to 2 decimals; named after --pollutant),
   City
 
 Usage:
   python pm.py --input_dir ./data --output monthly_pm25_monthly_avg_by_year.csv
+  python pm.py --input hourly_combined.csv --pollutant PM10 --output monthly_pm10.csv
+
+Files with a Parameter/Pollutant column (combine_daily.py output in any of its
+layouts except wide, including the default legacy one) are filtered to the
+requested pollutant first; the legacy "PM2.5 (avg)" column is then read as that
+pollutant's value.
+
+Per-file monthly sums/counts are cached by file contents (see derived_cache.py),
+so re-runs only re-read files that changed; pass --no-cache to bypass.
 """
 import argparse
 import glob
@@ -21,6 +31,9 @@ import re
 import pandas as pd
 import numpy as np
 
+from derived_cache import DerivedCache, add_cache_arguments
+from pollutants import POLLUTANTS, pollutant_key, value_candidates
+
 # Common candidate column names for date and PM2.5
 DATE_CANDIDATES = [
     "date", "Date", "datetime", "timestamp", "time", "Time", "DateLocal", "date_local"
@@ -29,23 +42,30 @@ PM_CANDIDATES = [
     "PM2.5", "PM2_5", "pm25", "pm2_5", "pm2.5", "pm_2_5", "value", "pm25_value", "pm25_concentration", "pm2"
 ]
 CITY_CANDIDATES = ["city", "City", "station", "Station", "location", "Location"]
+# bump when process_file/monthly_partial change their result so cached entries are not reused
+PARTIAL_CACHE_VERSION = 2
+# extra per-pollutant value column names on top of pollutants.value_candidates
+POLLUTANT_CANDIDATES = {"PM2.5": PM_CANDIDATES}
 
 def _normalize_name(s):
     return re.sub(r"[^a-z0-9]", "", str(s).lower())
 
-def find_column(df, candidates):
+def find_column(df, candidates, fuzzy=True, exclude=()):
+    columns = [col for col in df.columns if col not in exclude]
     # exact match first
     for c in candidates:
-        if c in df.columns:
+        if c in columns:
             return c
     # case-insensitive exact
-    cols_map = {col.lower(): col for col in df.columns}
+    cols_map = {col.lower(): col for col in columns}
     for c in candidates:
         if c.lower() in cols_map:
             return cols_map[c.lower()]
+    if not fuzzy:
+        return None
     # substring / normalized match (e.g. "PM2.5 (avg)" matches "pm25")
     norm_candidates = [_normalize_name(c) for c in candidates]
-    for col in df.columns:
+    for col in columns:
         ncol = _normalize_name(col)
         for nc in norm_candidates:
             if nc and (nc in ncol or ncol in nc):
@@ -57,10 +77,20 @@ def clean_numeric_series(s):
     s = s.str.replace(r"[^0-9.\-eE]", "", regex=True)
     return pd.to_numeric(s, errors="coerce")
 
-def process_file(path, city_override=None):
+def process_file(path, city_override=None, pollutant="PM2.5"):
     df = pd.read_csv(path)
     original_columns = list(df.columns)
 
+    # long multi-pollutant files: keep only the requested pollutant's rows
+    param_cols = [c for c in ("Pollutant", "Parameter") if c in df.columns]
+    if param_cols:
+        labels = df[param_cols[0]].astype(str)
+        keys = labels.map({l: pollutant_key(l) for l in labels.unique()})
+        df = df[keys == pollutant].reset_index(drop=True)
+        if df.empty:
+            print(f"Warning: no {pollutant} rows in {path}.", file=sys.stderr)
+            return None
+
     # Find date column (or construct from Year/Month[/Day])
     date_col = find_column(df, DATE_CANDIDATES)
     if date_col is None:
@@ -106,22 +136,30 @@ def process_file(path, city_override=None):
         print(f"ERROR: All parsed dates are NaT for {path}.", file=sys.stderr)
         return None
 
-    # Find PM2.5 column
-    pm_col = find_column(df, PM_CANDIDATES)
+    # Find pollutant value column. Short aliases such as "co" are matched exactly only:
+    # a substring match would hit unrelated columns (e.g. "_constructed_date").
+    city_col = find_column(df, CITY_CANDIDATES)
+    skip = {date_col, city_col, "City"}
+    exact = value_candidates(pollutant)
+    if param_cols:
+        # legacy combine_daily.py report: rows were filtered above, the value column keeps its PM2.5 name
+        exact = exact + ["PM2.5 (avg)"]
+    pm_col = find_column(df, exact, fuzzy=False, exclude=skip)
+    if pm_col is None and pollutant in POLLUTANT_CANDIDATES:
+        pm_col = find_column(df, POLLUTANT_CANDIDATES[pollutant], exclude=skip)
     if pm_col is None:
         numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        numeric_cols = [c for c in numeric_cols if c not in {find_column(df, ["Year"]) or "", find_column(df, ["Month"]) or "", find_column(df, ["Day"]) or "", find_column(df, ["Hour"]) or ""}]
+        numeric_cols = [c for c in numeric_cols if c not in skip | {find_column(df, ["Year"]) or "", find_column(df, ["Month"]) or "", find_column(df, ["Day"]) or "", find_column(df, ["Hour"]) or ""}]
         if numeric_cols:
             pm_col = numeric_cols[0]
-            print(f"Warning: PM2.5 column not explicitly found in {path}. Using first numeric column '{pm_col}'.", file=sys.stderr)
+            print(f"Warning: {pollutant} column not explicitly found in {path}. Using first numeric column '{pm_col}'.", file=sys.stderr)
         else:
-            print(f"ERROR: Could not find PM2.5 column in {path}. Columns: {original_columns}", file=sys.stderr)
+            print(f"ERROR: Could not find {pollutant} column in {path}. Columns: {original_columns}", file=sys.stderr)
             return None
 
     df[pm_col] = clean_numeric_series(df[pm_col])
 
     # City column
-    city_col = find_column(df, CITY_CANDIDATES)
     if city_override:
         df["City"] = city_override
     elif city_col:
@@ -134,9 +172,9 @@ def process_file(path, city_override=None):
     # keep rows with date and pm value
     df = df.dropna(subset=[date_col])
     df = df.loc[:, [date_col, pm_col, "City"]].copy()
-    df = df.rename(columns={date_col: "_date", pm_col: "PM2.5"})
-    df["PM2.5"] = pd.to_numeric(df["PM2.5"], errors="coerce")
-    df = df.dropna(subset=["PM2.5"])
+    df = df.rename(columns={date_col: "_date", pm_col: "Value"})
+    df["Value"] = pd.to_numeric(df["Value"], errors="coerce")
+    df = df.dropna(subset=["Value"])
 
     # add Year, Month_num and Month string (YYYY-MM) for each record
     df["_date"] = pd.to_datetime(df["_date"], errors="coerce")
@@ -146,12 +184,25 @@ def process_file(path, city_override=None):
 
     return df
 
+def monthly_partial(path, city_override=None, pollutant="PM2.5"):
+    """Per-file pollutant sum and count per City, Year and Month_num (mergeable across files)."""
+    df = process_file(path, city_override=city_override, pollutant=pollutant)
+    if df is None or df.empty:
+        return None
+    return (
+        df
+        .groupby(["City", "Year", "Month_num"], as_index=False)["Value"]
+        .agg(Value_Sum="sum", Value_Count="count")
+    )
+
 def main():
-    parser = argparse.ArgumentParser(description="Produce monthly average PM2.5 per Year+Month per city.")
+    parser = argparse.ArgumentParser(description="Produce monthly average PM2.5 (or --pollutant) per Year+Month per city.")
     parser.add_argument("--input", "-i", help="Single input CSV file")
     parser.add_argument("--input_dir", "-d", help="Directory containing CSV files (will read all *.csv)")
     parser.add_argument("--output", "-o", default="monthly_pm25_monthly_avg_by_year.csv", help="Output CSV path")
     parser.add_argument("--city", "-c", help="Optional city name override for files that lack a City column")
+    parser.add_argument("--pollutant", "-p", choices=POLLUTANTS, default="PM2.5", help="Pollutant to average (default PM2.5)")
+    add_cache_arguments(parser)
     args = parser.parse_args()
 
     if not args.input and not args.input_dir:
@@ -171,44 +222,41 @@ def main():
         print("No input files to process.", file=sys.stderr)
         sys.exit(1)
 
+    cache = DerivedCache.from_args(args)
     frames = []
     for f in sorted(set(input_files)):
         print(f"Processing {f} ...")
-        df = process_file(f, city_override=args.city)
-        if df is not None and not df.empty:
-            frames.append(df)
+        part = cache.cached("pm.monthly_partial", PARTIAL_CACHE_VERSION, [f], {"city": args.city, "pollutant": args.pollutant},
+                            lambda: monthly_partial(f, city_override=args.city, pollutant=args.pollutant))
+        if part is not None and not part.empty:
+            frames.append(part)
 
     if not frames:
         print("No valid results produced.", file=sys.stderr)
         sys.exit(1)
 
-    all_records = pd.concat(frames, ignore_index=True)
-
-    # Compute monthly average PM2.5 per City, Year and Month_num.
-    all_records["PM2.5"] = pd.to_numeric(all_records["PM2.5"], errors="coerce")
-    all_records = all_records.dropna(subset=["PM2.5"])
-
-    # group by City + Year + Month_num and compute mean
+    # Compute monthly average per City, Year and Month_num from per-file sums/counts
     grouped = (
-        all_records
-        .groupby(["City", "Year", "Month_num"], as_index=False)["PM2.5"]
-        .mean()
-        .round(2)
+        pd.concat(frames, ignore_index=True)
+        .groupby(["City", "Year", "Month_num"], as_index=False)[["Value_Sum", "Value_Count"]]
+        .sum()
     )
+    grouped[args.pollutant] = (grouped["Value_Sum"] / grouped["Value_Count"]).round(2)
 
     # create Month string YYYY-MM
     grouped["Year"] = grouped["Year"].astype(int)
     grouped["Month_num"] = grouped["Month_num"].astype(int)
     grouped["Month"] = grouped.apply(lambda r: f"{int(r['Year'])}-{int(r['Month_num']):02d}", axis=1)
 
-    # Ensure columns and order: Month (YYYY-MM), Year, Month_num, PM2.5, City
-    out = grouped[["Month", "Year", "Month_num", "PM2.5", "City"]].copy()
+    # Ensure columns and order: Month (YYYY-MM), Year, Month_num, <pollutant>, City
+    out = grouped[["Month", "Year", "Month_num", args.pollutant, "City"]].copy()
 
     # Sort by Year then Month_num then City so output lists months per year sequentially
     out = out.sort_values(["Year", "Month_num", "City"]).reset_index(drop=True)
 
     out.to_csv(args.output, index=False)
     print(f"Wrote monthly averages by year to: {args.output}")
+    cache.report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,86 @@
+"""
+Pollutant names, US EPA AQI breakpoint tables and vectorized AQI helpers.
+
+Concentrations are expected in the units used by AirNow station exports:
+PM2.5/PM10 in ug/m3, O3/NO2/SO2 in ppb and CO in ppm. Hourly values are
+scored against these tables directly (no NowCast or 8-hour averaging).
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# (C_lo, C_hi, I_lo, I_hi) per band, ascending
+AQI_BREAKPOINTS = {
+    # PM2.5 24-hour (pre-2024 table, matching the categories the reports always used)
+    "PM2.5": [(0.0, 12.0, 0, 50), (12.1, 35.4, 51, 100), (35.5, 55.4, 101, 150),
+              (55.5, 150.4, 151, 200), (150.5, 250.4, 201, 300), (250.5, 350.4, 301, 400),
+              (350.5, 500.4, 401, 500)],
+    "PM10": [(0, 54, 0, 50), (55, 154, 51, 100), (155, 254, 101, 150), (255, 354, 151, 200),
+             (355, 424, 201, 300), (425, 504, 301, 400), (505, 604, 401, 500)],
+    # 1-hour table: EPA defines no 1-hour O3 AQI below 125 ppb, so those hours get NA
+    "O3": [(125, 164, 101, 150), (165, 204, 151, 200), (205, 404, 201, 300),
+           (405, 504, 301, 400), (505, 604, 401, 500)],
+    "NO2": [(0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150), (361, 649, 151, 200),
+            (650, 1249, 201, 300), (1250, 1649, 301, 400), (1650, 2049, 401, 500)],
+    "SO2": [(0, 35, 0, 50), (36, 75, 51, 100), (76, 185, 101, 150), (186, 304, 151, 200),
+            (305, 604, 201, 300), (605, 804, 301, 400), (805, 1004, 401, 500)],
+    "CO": [(0.0, 4.4, 0, 50), (4.5, 9.4, 51, 100), (9.5, 12.4, 101, 150), (12.5, 15.4, 151, 200),
+           (15.5, 30.4, 201, 300), (30.5, 40.4, 301, 400), (40.5, 50.4, 401, 500)],
+}
+
+POLLUTANTS = list(AQI_BREAKPOINTS)
+
+_ALIASES = {
+    "pm25": "PM2.5", "pm2": "PM2.5", "pm10": "PM10", "o3": "O3", "ozone": "O3",
+    "no2": "NO2", "so2": "SO2", "co": "CO",
+}
+
+# WHO 2021 24-hour air quality guidelines, converted to the export units above at 25 C
+# (O3 has only an 8-hour peak-season guideline, so no daily exceedance is counted)
+WHO_DAILY_GUIDELINES = {"PM2.5": 15.0, "PM10": 45.0, "NO2": 13.3, "SO2": 15.3, "CO": 3.5}
+
+AQI_CATEGORIES = ["Good", "Moderate", "Unhealthy for Sensitive Groups", "Unhealthy", "Very Unhealthy", "Hazardous"]
+_CATEGORY_UPPER = [50, 100, 150, 200, 300]
+
+
+def pollutant_key(parameter):
+    """Canonical pollutant for a Parameter label, e.g. 'PM2.5 - Principal' -> 'PM2.5'.
+
+    Unrecognized labels are returned stripped and get no computed AQI.
+    """
+    text = str(parameter).strip()
+    head = re.split(r"\s+-\s+|[\s(,]", text, maxsplit=1)[0]
+    return _ALIASES.get(re.sub(r"[^a-z0-9]", "", head.lower()), text)
+
+
+def value_candidates(pollutant):
+    """Column names a per-pollutant concentration may appear under (exact names first)."""
+    aliases = [a for a, p in _ALIASES.items() if p == pollutant]
+    return [f"{pollutant} (avg)", pollutant] + aliases + ["Conc (avg)", "Raw Conc.", "value"]
+
+
+def concentration_to_aqi(pollutant, conc):
+    """Vectorized EPA AQI for an array of concentrations.
+
+    NaN for unknown pollutants and for values below the first band of a table that
+    does not start at zero (hourly O3 under 125 ppb).
+    """
+    conc = np.asarray(conc, dtype=float)
+    table = AQI_BREAKPOINTS.get(pollutant)
+    if table is None:
+        return np.full(conc.shape, np.nan)
+    c_lo, c_hi, i_lo, i_hi = (np.array(col, dtype=float) for col in zip(*table))
+    idx = np.clip(np.searchsorted(c_hi, conc, side="left"), 0, len(table) - 1)
+    # values falling between bands (e.g. 12.05) are scored at the upper band's floor
+    c = np.clip(conc, c_lo[idx], c_hi[idx])
+    aqi = (i_hi[idx] - i_lo[idx]) / (c_hi[idx] - c_lo[idx]) * (c - c_lo[idx]) + i_lo[idx]
+    return np.where(np.isnan(conc) | (conc < c_lo[0]), np.nan, aqi)
+
+
+def aqi_categories(aqi):
+    """Vectorized AQI -> category label (NA where AQI is missing)."""
+    aqi = pd.to_numeric(pd.Series(aqi), errors="coerce").astype(float)
+    codes = np.searchsorted(_CATEGORY_UPPER, aqi.to_numpy(), side="left")
+    labels = np.array(AQI_CATEGORIES, dtype=object)[np.minimum(codes, len(AQI_CATEGORIES) - 1)]
+    return pd.Series(np.where(aqi.isna(), pd.NA, labels), index=aqi.index, dtype=object)
@@ -11,6 +11,10 @@ Output columns: YEAR, MONTH, LEVEL (AVG)
 Examples:
   python predict.py predicted_hanoi.csv --out monthly_long.csv
   python predict.py predicted_Manila.csv --project --start-year 2026 --years 3 --out monthly_long.csv --pivot-out Manila_monthly_pivot.csv
+
+Monthly means and climatology are cached per input file contents (see
+derived_cache.py), so repeated projections skip re-reading the CSV; pass
+--no-cache to bypass.
 """
 import argparse
 import sys
@@ -19,6 +23,11 @@ from pathlib import Path
 import numpy as np
 import pandas as pd
 
+from derived_cache import DerivedCache, add_cache_arguments
+
+# bump when load_monthly's result changes so cached entries are not reused
+MONTHLY_CACHE_VERSION = 1
+
 
 def find_column(df, pattern):
     """Return first column name containing all tokens in pattern (case-insensitive)."""
@@ -30,27 +39,12 @@ def find_column(df, pattern):
     return None
 
 
-def main():
-    p = argparse.ArgumentParser(description="Produce YEAR, MONTH, LEVEL (AVG) for monthly predicted PM2.5")
-    p.add_argument("csv", nargs="?", default="predicted_hanoi.csv", help="CSV file path (default predicted_hanoi.csv)")
-    p.add_argument("--out", "-o", help="Write output CSV (default: monthly_pm25_{start}_x{n}.csv or monthly_pm25_from_data.csv)")
-    p.add_argument("--pivot-out", help="Write pivot table (Year x Month) CSV")
-    p.add_argument("--project", action="store_true", help="Build future grid and fill with monthly climatology (use with --start-year and --years)")
-    p.add_argument("--start-year", type=int, default=2026, help="Start year for projection (default 2026)")
-    p.add_argument("--years", type=int, default=3, help="Number of years to project (default 3)")
-    p.add_argument("--month-col", help="Override date column name (e.g. 'predict_day_(t+3)')")
-    p.add_argument("--value-col", help="Override value column name (e.g. 'predict_value_(t+3)')")
-    args = p.parse_args()
-
-    csv_path = Path(args.csv)
-    if not csv_path.exists():
-        print(f"File not found: {csv_path}", file=sys.stderr)
-        sys.exit(2)
-
+def load_monthly(csv_path, value_col_override=None, month_col_override=None):
+    """Read predictions and derive Year+Month means, calendar-month climatology and overall mean."""
     df = pd.read_csv(csv_path, low_memory=False)
 
     # detect value column (prefer predict_value_(t+3))
-    value_col = args.value_col or find_column(df, "predict_value t+3") or find_column(df, "predict_value") or find_column(df, "predict value")
+    value_col = value_col_override or find_column(df, "predict_value t+3") or find_column(df, "predict_value") or find_column(df, "predict value")
     if value_col is None:
         if "predict_value_(t+3)" in df.columns:
             value_col = "predict_value_(t+3)"
@@ -60,7 +54,7 @@ def main():
             sys.exit(3)
 
     # detect date column (prefer predict_day_(t+3), fallback original_day or any datetime-looking column)
-    date_col = args.month_col or find_column(df, "predict_day t+3") or find_column(df, "predict_day") or find_column(df, "predict day") or find_column(df, "original_day")
+    date_col = month_col_override or find_column(df, "predict_day t+3") or find_column(df, "predict_day") or find_column(df, "predict day") or find_column(df, "original_day")
     if date_col is None:
         candidate = None
         for c in df.columns:
@@ -103,6 +97,43 @@ def main():
     )
     grouped = grouped.rename(columns={"pm25": "Level_avg"})
 
+    # climatology computed from working raw predictions by calendar month
+    climatology = (
+        working
+        .dropna(subset=["pm25"])
+        .groupby("Month", as_index=False)["pm25"]
+        .mean()
+        .rename(columns={"pm25": "Clim_avg"})
+    )
+    return {"grouped": grouped, "climatology": climatology, "overall_avg": working["pm25"].mean()}
+
+
+def main():
+    p = argparse.ArgumentParser(description="Produce YEAR, MONTH, LEVEL (AVG) for monthly predicted PM2.5")
+    p.add_argument("csv", nargs="?", default="predicted_hanoi.csv", help="CSV file path (default predicted_hanoi.csv)")
+    p.add_argument("--out", "-o", help="Write output CSV (default: monthly_pm25_{start}_x{n}.csv or monthly_pm25_from_data.csv)")
+    p.add_argument("--pivot-out", help="Write pivot table (Year x Month) CSV")
+    p.add_argument("--project", action="store_true", help="Build future grid and fill with monthly climatology (use with --start-year and --years)")
+    p.add_argument("--start-year", type=int, default=2026, help="Start year for projection (default 2026)")
+    p.add_argument("--years", type=int, default=3, help="Number of years to project (default 3)")
+    p.add_argument("--month-col", help="Override date column name (e.g. 'predict_day_(t+3)')")
+    p.add_argument("--value-col", help="Override value column name (e.g. 'predict_value_(t+3)')")
+    add_cache_arguments(p)
+    args = p.parse_args()
+
+    csv_path = Path(args.csv)
+    if not csv_path.exists():
+        print(f"File not found: {csv_path}", file=sys.stderr)
+        sys.exit(2)
+
+    cache = DerivedCache.from_args(args)
+    monthly = cache.cached(
+        "predict.monthly", MONTHLY_CACHE_VERSION, [csv_path],
+        {"value_col": args.value_col, "month_col": args.month_col},
+        lambda: load_monthly(csv_path, args.value_col, args.month_col),
+    )
+    grouped = monthly["grouped"]
+
     # optionally write pivot of observed grouped data (non-projected)
     if args.pivot_out and not args.project:
         pivot_obs = grouped.pivot(index="Year", columns="Month", values="Level_avg")
@@ -122,19 +153,10 @@ def main():
         grid = [{"Year": y, "Month": m} for y in years for m in months]
         grid_df = pd.DataFrame(grid)
 
-        # climatology computed from working raw predictions by calendar month
-        climatology = (
-            working
-            .dropna(subset=["pm25"])
-            .groupby("Month", as_index=False)["pm25"]
-            .mean()
-            .rename(columns={"pm25": "Clim_avg"})
-        )
-
-        merged = grid_df.merge(climatology, on="Month", how="left")
+        merged = grid_df.merge(monthly["climatology"], on="Month", how="left")
         
         # **FIX**: If any months are still missing, fill them with the overall average.
-        overall_avg = working["pm25"].mean()
+        overall_avg = monthly["overall_avg"]
         merged["Clim_avg"] = merged["Clim_avg"].fillna(overall_avg)
         
         merged["Level (AVG)"] = merged["Clim_avg"].round(2)
@@ -153,6 +175,7 @@ def main():
     out_path = args.out or (f"monthly_pm25_{int(args.start_year)}_x{int(args.years)}.csv" if args.project else "monthly_pm25_from_data.csv")
     result.to_csv(out_path, index=False)
     print(f"\nWrote output to {out_path}")
+    cache.report()
 
 
 if __name__ == "__main__":
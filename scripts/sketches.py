@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Streaming quantile sketches (DDSketch) for concentration distributions.
+
+A DDSketch buckets positive values on a logarithmic grid so every quantile it
+returns is within `relative_accuracy` (default 1%) of the exact value, using a
+few hundred counters regardless of how many hours were added. Sketches with the
+same accuracy merge exactly by adding bucket counts, so sketch tables from
+separate runs can be combined and rolled up to any coarser grouping (site-month
+-> site-year -> site) without revisiting the hourly data.
+
+Sketch tables map (Site, Pollutant, Year, Month) to a DDSketch of that month's
+hourly mean concentrations (one value per site-hour, however many raw readings
+fed it) and are stored as CSV with one compact base64 sketch per row.
+
+Usage:
+  python sketches.py query --sketches site_month_sketches.csv --by Site Pollutant Year
+  python sketches.py benchmark --n 2000000
+"""
+import argparse
+import base64
+import math
+import struct
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from pollutants import pollutant_key
+
+SKETCH_KEYS = ["Site", "Pollutant", "Year", "Month"]
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+# values at or below this are counted as zero rather than log-bucketed
+MIN_VALUE = 1e-6
+_HEADER = struct.Struct("<dqddd")
+
+
+def _encode_varint(n, out):
+    while True:
+        b = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return
+
+
+def _decode_varint(buf, pos):
+    shift = 0
+    n = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return n, pos
+        shift += 7
+
+
+class DDSketch:
+    """Relative-error quantile sketch over non-negative values."""
+
+    def __init__(self, relative_accuracy=0.01):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    @property
+    def count(self):
+        return self.zero_count + sum(self.bins.values())
+
+    def bucket_index(self, values):
+        """Vectorized log-bucket index for positive values."""
+        return np.ceil(np.log(np.asarray(values, dtype=float)) / self._log_gamma).astype(np.int64)
+
+    def add_many(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        positive = values[values > MIN_VALUE]
+        idx, counts = np.unique(self.bucket_index(positive), return_counts=True)
+        self.add_bins(idx, counts, values.size - positive.size, values.sum(), values.min(), values.max())
+        return self
+
+    def add_bins(self, indices, counts, zero_count=0, total=0.0, vmin=math.inf, vmax=-math.inf):
+        """Add pre-bucketed counts (used by the vectorized table builder)."""
+        bins = self.bins
+        for i, c in zip(np.asarray(indices).tolist(), np.asarray(counts).tolist()):
+            bins[i] = bins.get(i, 0) + c
+        self.zero_count += int(zero_count)
+        self.sum += float(total)
+        self.min = min(self.min, float(vmin))
+        self.max = max(self.max, float(vmax))
+        return self
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("cannot merge sketches with different relative accuracy")
+        return self.add_bins(list(other.bins), list(other.bins.values()),
+                             other.zero_count, other.sum, other.min, other.max)
+
+    def copy(self):
+        return DDSketch(self.relative_accuracy).merge(self)
+
+    def quantile(self, q):
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs):
+        """Approximate quantiles (0 <= q <= 1); NaN for an empty sketch."""
+        n = self.count
+        if n == 0:
+            return [math.nan for _ in qs]
+        keys = sorted(self.bins)
+        cum = np.cumsum([self.bins[k] for k in keys]) + self.zero_count
+        out = []
+        for q in qs:
+            rank = q * (n - 1)
+            if rank < self.zero_count:
+                value = 0.0
+            else:
+                i = keys[min(int(np.searchsorted(cum, rank, side="right")), len(keys) - 1)]
+                value = 2 * self.gamma ** i / (self.gamma + 1)
+            out.append(min(max(value, self.min), self.max))
+        return out
+
+    def to_bytes(self):
+        """Compact binary form: fixed header, then delta/zigzag-varint bucket indices and varint counts."""
+        out = bytearray(_HEADER.pack(self.relative_accuracy, self.zero_count, self.sum, self.min, self.max))
+        keys = sorted(self.bins)
+        _encode_varint(len(keys), out)
+        prev = 0
+        for k in keys:
+            d = k - prev
+            _encode_varint((d << 1) ^ (d >> 63), out)
+            _encode_varint(self.bins[k], out)
+            prev = k
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        alpha, zero_count, total, vmin, vmax = _HEADER.unpack_from(data, 0)
+        sketch = cls(alpha)
+        sketch.zero_count, sketch.sum, sketch.min, sketch.max = zero_count, total, vmin, vmax
+        n, pos = _decode_varint(data, _HEADER.size)
+        prev = 0
+        for _ in range(n):
+            z, pos = _decode_varint(data, pos)
+            c, pos = _decode_varint(data, pos)
+            prev += (z >> 1) ^ -(z & 1)
+            sketch.bins[prev] = c
+        return sketch
+
+    def to_string(self):
+        return base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def from_string(cls, text):
+        return cls.from_bytes(base64.b64decode(text))
+
+
+def build_sketches(partial, relative_accuracy=0.01):
+    """Sketch table {(Site, Pollutant, Year, Month): DDSketch} of hourly means.
+
+    `partial` is a merged combine_daily.py per-hour partial, so every site-hour
+    contributes its mean concentration once.
+    """
+    labels = partial["Parameter"].unique()
+    count = partial["RawConc_Count"].to_numpy(dtype=float)
+    mean = np.divide(partial["RawConc_Sum"].to_numpy(dtype=float), count,
+                     out=np.full(len(partial), np.nan), where=count > 0)
+    df = pd.DataFrame({
+        "Site": partial["Site"].to_numpy(),
+        "Pollutant": partial["Parameter"].map({l: pollutant_key(l) for l in labels}).to_numpy(),
+        "Year": partial["Year"].astype(int).to_numpy(),
+        "Month": partial["Month"].astype(int).to_numpy(),
+        "v": mean,
+    }).dropna(subset=["v"])
+    proto = DDSketch(relative_accuracy)
+    positive = df["v"] > MIN_VALUE
+    df["bucket"] = np.where(positive, proto.bucket_index(df["v"].where(positive, 1.0)), 0)
+    df["zero"] = ~positive
+
+    table = {}
+    stats = df.groupby(SKETCH_KEYS).agg(zero=("zero", "sum"), total=("v", "sum"), vmin=("v", "min"), vmax=("v", "max"))
+    for key, row in stats.iterrows():
+        table[key] = DDSketch(relative_accuracy).add_bins([], [], row["zero"], row["total"], row["vmin"], row["vmax"])
+    bucketed = df[positive].groupby(SKETCH_KEYS + ["bucket"]).size()
+    for key, grp in bucketed.groupby(level=SKETCH_KEYS):
+        table[key].add_bins(grp.index.get_level_values("bucket"), grp.to_numpy())
+    return table
+
+
+def merge_tables(tables):
+    """Merge sketch tables from several runs (inputs are left untouched)."""
+    merged = {}
+    for table in tables:
+        if not table:
+            continue
+        for key, sketch in table.items():
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = sketch.copy()
+    return merged
+
+
+def rollup(table, by):
+    """Merge a sketch table up to the coarser grouping `by` (a subset of SKETCH_KEYS)."""
+    pos = [SKETCH_KEYS.index(k) for k in by]
+    out = {}
+    for key, sketch in table.items():
+        coarse = tuple(key[i] for i in pos)
+        if coarse in out:
+            out[coarse].merge(sketch)
+        else:
+            out[coarse] = sketch.copy()
+    return out
+
+
+def quantile_frame(table, by=SKETCH_KEYS, quantiles=DEFAULT_QUANTILES):
+    """One row per group in `by` with Hours, Mean and p<q> columns."""
+    rolled = rollup(table, by) if list(by) != SKETCH_KEYS else table
+    records = []
+    for key in sorted(rolled):
+        sketch = rolled[key]
+        n = sketch.count
+        rec = dict(zip(by, key))
+        rec["Hours"] = n
+        rec["Mean"] = round(sketch.sum / n, 2) if n else math.nan
+        for q, v in zip(quantiles, sketch.quantiles(quantiles)):
+            rec[f"p{q * 100:g}"] = round(v, 2)
+        records.append(rec)
+    return pd.DataFrame.from_records(records, columns=list(by) + ["Hours", "Mean"] + [f"p{q * 100:g}" for q in quantiles])
+
+
+def save_table(table, path):
+    rows = [list(key) + [sketch.to_string()] for key, sketch in sorted(table.items())]
+    pd.DataFrame(rows, columns=SKETCH_KEYS + ["Sketch"]).to_csv(path, index=False)
+
+
+def load_table(path):
+    df = pd.read_csv(path, dtype={"Site": str, "Pollutant": str})
+    return {(r.Site, r.Pollutant, int(r.Year), int(r.Month)): DDSketch.from_string(r.Sketch)
+            for r in df.itertuples(index=False)}
+
+
+def benchmark(n=1_000_000, chunks=8, relative_accuracy=0.01, quantiles=(0.5, 0.9, 0.95, 0.99, 0.999), seed=0):
+    """Compare DDSketch against exact np.percentile on lognormal PM-like data."""
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=np.log(30), sigma=0.7, size=n)
+
+    t0 = time.perf_counter()
+    exact = np.percentile(values, [q * 100 for q in quantiles])
+    t_exact = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    sketch = DDSketch(relative_accuracy).add_many(values)
+    t_build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    parts = [DDSketch(relative_accuracy).add_many(c) for c in np.array_split(values, chunks)]
+    merged = DDSketch(relative_accuracy)
+    for p in parts:
+        merged.merge(p)
+    t_merge = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    approx = sketch.quantiles(quantiles)
+    t_query = time.perf_counter() - t0
+
+    print(f"n={n:,} relative_accuracy={relative_accuracy} buckets={len(sketch.bins)} "
+          f"serialized={len(sketch.to_bytes())} bytes (raw float64: {values.nbytes:,} bytes)")
+    print(f"exact np.percentile: {t_exact * 1e3:.1f} ms | sketch build: {t_build * 1e3:.1f} ms | "
+          f"{chunks}-way build+merge: {t_merge * 1e3:.1f} ms | query: {t_query * 1e3:.3f} ms")
+    print(f"merged sketch identical to single-pass sketch: {merged.bins == sketch.bins}")
+    print(f"{'q':>7} {'exact':>10} {'sketch':>10} {'rel.err':>9}")
+    for q, e, a in zip(quantiles, exact, approx):
+        print(f"{q:>7g} {e:>10.3f} {a:>10.3f} {abs(a - e) / e:>9.4%}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Query sketch tables or benchmark DDSketch against exact percentiles.")
+    sub = p.add_subparsers(dest="command", required=True)
+    q = sub.add_parser("query", help="Merge sketch table(s) and print quantiles at any grouping.")
+    q.add_argument("--sketches", nargs="+", required=True, help="Sketch table CSV(s) written by combine_daily.py/ingest.py --sketch-out.")
+    q.add_argument("--by", nargs="+", default=SKETCH_KEYS, choices=SKETCH_KEYS, help="Grouping columns (default Site Pollutant Year Month).")
+    q.add_argument("--quantiles", nargs="+", type=float, default=list(DEFAULT_QUANTILES), help="Quantiles in [0, 1] (default 0.5 0.95 0.99).")
+    q.add_argument("--out", "-o", help="Write result CSV instead of printing.")
+    b = sub.add_parser("benchmark", help="Accuracy and speed versus np.percentile.")
+    b.add_argument("--n", type=int, default=1_000_000, help="Number of synthetic values (default 1,000,000).")
+    b.add_argument("--chunks", type=int, default=8, help="Partitions to build and merge (default 8).")
+    b.add_argument("--relative-accuracy", type=float, default=0.01, help="Sketch relative accuracy (default 0.01).")
+    args = p.parse_args()
+
+    if args.command == "benchmark":
+        benchmark(args.n, args.chunks, args.relative_accuracy)
+        return
+
+    table = merge_tables(load_table(f) for f in args.sketches)
+    if not table:
+        print("No sketches found.", file=sys.stderr)
+        sys.exit(1)
+    result = quantile_frame(table, args.by, args.quantiles)
+    if args.out:
+        result.to_csv(args.out, index=False)
+        print(f"Wrote {len(result)} rows to {args.out}")
+    else:
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Aggregation, layout and exceedance tests for combine_daily.py (run with pytest from scripts/)."""
+import numpy as np
+import pandas as pd
+
+from combine_daily import daily_exceedances, finalize, merge_partials, partial_aggregate
+
+
+def hourly_rows(rows):
+    """Normalized rows from (site, parameter, day, hour, conc) tuples in January 2023."""
+    df = pd.DataFrame(rows, columns=["Site", "Parameter", "Day", "Hour", "RawConc"])
+    df["Year"] = 2023
+    df["Month"] = 1
+    for c in ["Year", "Month", "Day", "Hour"]:
+        df[c] = df[c].astype("Int64")
+    df["AQI"] = np.nan
+    return df[["Site", "Parameter", "Year", "Month", "Day", "Hour", "RawConc", "AQI"]]
+
+
+def test_wide_layout_with_na_aqi():
+    rows = hourly_rows([
+        ("Hanoi", "PM2.5 - Principal", 1, 0, 40.0),
+        ("Hanoi", "O3", 1, 0, 60.0),          # under 125 ppb: no 1-hour AQI
+        ("Hanoi", "O3", 1, 1, 180.0),
+        ("Hanoi", "Mystery Gas", 1, 1, 5.0),  # unknown label: no AQI
+    ])
+    out = finalize(partial_aggregate(rows), "wide").set_index("Hour")
+
+    assert list(out.columns[4:]) == ["PM2.5 (avg)", "PM2.5 AQI", "O3 (avg)", "O3 AQI",
+                                     "Mystery Gas (avg)", "Mystery Gas AQI", "AQI", "Category",
+                                     "Dominant Pollutant"]
+    assert pd.isna(out.loc[0, "O3 AQI"]) and pd.isna(out.loc[1, "Mystery Gas AQI"])
+    assert out.loc[0, "AQI"] == out.loc[0, "PM2.5 AQI"] == 112
+    assert out.loc[0, "Dominant Pollutant"] == "PM2.5"
+    assert out.loc[1, "Dominant Pollutant"] == "O3" and out.loc[1, "Category"] == "Unhealthy"
+
+
+def test_legacy_layout_keeps_original_columns():
+    rows = hourly_rows([("Hanoi", "PM2.5 - Principal", 1, 0, 10.0), ("Hanoi", "PM2.5 - Principal", 1, 0, 20.0)])
+    out = finalize(partial_aggregate(rows))
+    assert list(out.columns) == ["Site", "Parameter", "Year", "Month", "Day", "Hour",
+                                 "PM2.5 (avg)", "Category", "Observations"]
+    assert out.loc[0, "PM2.5 (avg)"] == 15.0 and out.loc[0, "Category"] == "Moderate"
+    assert out.loc[0, "Observations"] == 2
+
+
+def test_partials_merge_like_concatenated_rows():
+    a = hourly_rows([("Hanoi", "PM10", 1, 0, 10.0), ("Hanoi", "PM10", 1, 1, 30.0)])
+    b = hourly_rows([("Hanoi", "PM10", 1, 0, 20.0)])
+    merged = merge_partials([partial_aggregate(a), partial_aggregate(b)])
+    direct = partial_aggregate(pd.concat([a, b], ignore_index=True))
+    pd.testing.assert_frame_equal(finalize(merged, "long"), finalize(direct, "long"))
+
+
+
+def test_daily_exceedances_use_daily_means():
+    rows = hourly_rows(
+        # day 1 mean 14 (below 15), day 2 mean 16 (above), day 3 a single 100 reading
+        [("Hanoi", "PM2.5 - Principal", 1, h, v) for h, v in enumerate([10.0, 18.0])]
+        + [("Hanoi", "PM2.5 - Principal", 2, h, v) for h, v in enumerate([12.0, 20.0])]
+        + [("Hanoi", "PM2.5 - Principal", 3, 0, 100.0)]
+        + [("Hanoi", "O3", 1, 0, 300.0)]
+    )
+    out = daily_exceedances(partial_aggregate(rows)).set_index("Pollutant")
+    assert out.loc["PM2.5", "Days"] == 3
+    assert out.loc["PM2.5", "Days Above WHO"] == 2
+    assert out.loc["PM2.5", "WHO Guideline"] == 15.0
+    assert pd.isna(out.loc["O3", "Days Above WHO"])
@@ -0,0 +1,45 @@
+"""Hit/miss, None-result and digest-index tests for derived_cache.py (run with pytest from scripts/)."""
+import json
+import os
+import sys
+
+import derived_cache
+from derived_cache import DIGEST_INDEX, DerivedCache
+
+
+def test_none_result_is_a_hit_until_input_changes(tmp_path):
+    src = tmp_path / "bad.csv"
+    src.write_text("not,a,station,export\n")
+    cache = DerivedCache(str(tmp_path / "cache"))
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return None
+
+    for _ in range(3):
+        assert cache.cached("test.kind", 1, [str(src)], {}, compute) is None
+    assert (len(calls), cache.hits, cache.misses) == (1, 2, 1)
+
+    src.write_text("still,not,valid\n1,2,3\n")
+    assert cache.cached("test.kind", 1, [str(src)], {}, compute) is None
+    assert (len(calls), cache.misses) == (2, 2)
+
+
+def test_digest_index_drops_missing_inputs_and_clear_removes_it(tmp_path, monkeypatch, capsys):
+    cache_dir = tmp_path / "cache"
+    cache = DerivedCache(str(cache_dir))
+    old, new = tmp_path / "old.csv", tmp_path / "new.csv"
+    old.write_text("a\n1\n")
+    new.write_text("a\n2\n")
+    cache.cached("test.kind", 1, [str(old)], {}, lambda: 1)
+    os.remove(old)
+    cache.cached("test.kind", 1, [str(new)], {}, lambda: 2)
+
+    with open(cache_dir / DIGEST_INDEX) as fh:
+        assert list(json.load(fh)) == [str(new)]
+
+    monkeypatch.setattr(sys, "argv", ["derived_cache.py", "--cache-dir", str(cache_dir), "--clear"])
+    derived_cache.main()
+    assert "Removed 2 entries" in capsys.readouterr().out
+    assert os.listdir(cache_dir) == []
@@ -0,0 +1,143 @@
+"""Checkpoint/resume and source-listing tests for ingest.py (run with pytest from scripts/)."""
+import functools
+import gzip
+import http.server
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+
+import ingest
+from combine_daily import finalize
+
+SORT = ["Site", "Parameter", "Year", "Month", "Day", "Hour"]
+
+
+def write_export(path, site, year, value=20.0):
+    rows = [{"Site": site, "Parameter": "PM2.5 - Principal", "Year": year, "Month": 1, "Day": d, "Hour": h,
+             "Raw Conc.": value + d + h, "AQI": "", "QC Name": "Valid"}
+            for d in range(1, 4) for h in range(24)]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    csv = pd.DataFrame(rows).to_csv(index=False)
+    if path.endswith(".gz"):
+        with gzip.open(path, "wt") as fh:
+            fh.write(csv)
+    else:
+        with open(path, "w") as fh:
+            fh.write(csv)
+
+
+@pytest.fixture
+def source(tmp_path):
+    src = tmp_path / "raw"
+    write_export(str(src / "Hanoi_2022.csv"), "Hanoi", 2022)
+    write_export(str(src / "Hanoi_2023.csv.gz"), "Hanoi", 2023)
+    write_export(str(src / "sub" / "Manila_2023.csv"), "Manila", 2023)
+    return str(src)
+
+
+def report(partial):
+    return finalize(partial).sort_values(SORT).reset_index(drop=True)
+
+
+def run(source, ckpt, **kwargs):
+    kwargs.setdefault("workers", 1)
+    kwargs.setdefault("queue_size", 1)
+    kwargs.setdefault("checkpoint_every", 1)
+    return ingest.ingest(source, str(ckpt), **kwargs)
+
+
+def test_interrupted_run_resumes(source, tmp_path, monkeypatch, capsys):
+    expected, _ = run(source, tmp_path / "full")
+
+    real_save = ingest.save_checkpoint
+
+    def crash_after_first(*args, **kwargs):
+        real_save(*args, **kwargs)
+        raise KeyboardInterrupt
+
+    ckpt = tmp_path / "ckpt"
+    monkeypatch.setattr(ingest, "save_checkpoint", crash_after_first)
+    with pytest.raises(KeyboardInterrupt):
+        run(source, ckpt)
+    monkeypatch.setattr(ingest, "save_checkpoint", real_save)
+
+    with open(ckpt / ingest.STATE_FILE) as fh:
+        first_state = json.load(fh)
+    assert len(first_state["done"]) == 1
+
+    capsys.readouterr()
+    partial, complete = run(source, ckpt)
+    assert "Resuming: 1 of 3" in capsys.readouterr().out
+    assert complete
+    pd.testing.assert_frame_equal(report(partial), report(expected))
+
+    # numbering continues, so a resumed run never rewrites the file state.json points at
+    with open(ckpt / ingest.STATE_FILE) as fh:
+        state = json.load(fh)
+    assert state["seq"] > first_state["seq"]
+    assert sorted(os.listdir(ckpt)) == sorted([ingest.STATE_FILE, state["partial"]])
+
+
+def test_checkpoint_for_other_source_is_discarded(source, tmp_path, capsys):
+    other = tmp_path / "other"
+    write_export(str(other / "Hanoi_2022.csv"), "Jakarta", 2022)
+    ckpt = tmp_path / "ckpt"
+    run(source, ckpt)
+
+    capsys.readouterr()
+    partial, _ = run(str(other), ckpt)
+    out = capsys.readouterr().out
+    assert "different source" in out and "Resuming" not in out
+    assert set(partial["Site"]) == {"Jakarta"}
+
+
+def test_changed_file_is_reread(source, tmp_path, capsys):
+    ckpt = tmp_path / "ckpt"
+    run(source, ckpt)
+    path = os.path.join(source, "Hanoi_2022.csv")
+    write_export(path, "Hanoi", 2022, value=90.0)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    capsys.readouterr()
+    partial, _ = run(source, ckpt)
+    assert "changed since the checkpoint" in capsys.readouterr().out
+    expected, _ = run(source, tmp_path / "fresh")
+    pd.testing.assert_frame_equal(report(partial), report(expected))
+
+
+def test_http_listing_matches_local_tree(source):
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=source)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/"
+        remote = [name for name, _ in ingest.list_sources(url)]
+    finally:
+        server.shutdown()
+    local = [name.replace(os.sep, "/") for name, _ in ingest.list_sources(source)]
+    assert remote == local == ["Hanoi_2022.csv", "Hanoi_2023.csv.gz", "sub/Manila_2023.csv"]
+
+
+@pytest.mark.parametrize("damage, message", [
+    (lambda ckpt, state: (ckpt / ingest.STATE_FILE).write_text('{"source": "trunc'), "unreadable"),
+    (lambda ckpt, state: (ckpt / ingest.STATE_FILE).write_text("[]"), "malformed"),
+    (lambda ckpt, state: os.remove(ckpt / state["partial"]), "unreadable"),
+])
+def test_damaged_checkpoint_starts_over(source, tmp_path, capsys, damage, message):
+    expected, _ = run(source, tmp_path / "full")
+    ckpt = tmp_path / "ckpt"
+    run(source, ckpt)
+    with open(ckpt / ingest.STATE_FILE) as fh:
+        damage(ckpt, json.load(fh))
+
+    capsys.readouterr()
+    partial, complete = run(source, ckpt)
+    out = capsys.readouterr().out
+    assert message in out and "starting over" in out and "Resuming" not in out
+    assert complete
+    pd.testing.assert_frame_equal(report(partial), report(expected))
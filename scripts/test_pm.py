@@ -0,0 +1,33 @@
+"""Value-column lookup tests for pm.py (run with pytest from scripts/)."""
+import pandas as pd
+import pytest
+
+import pm
+
+
+@pytest.fixture
+def legacy_report(tmp_path):
+    """combine_daily.py default (legacy) output holding three pollutants."""
+    rows = []
+    for param, base in [("PM2.5 - Principal", 30.0), ("PM10", 60.0), ("CO", 0.5)]:
+        for day in (1, 2):
+            rows.append({"Site": "Hanoi", "Parameter": param, "Year": 2023, "Month": 1, "Day": day, "Hour": 0,
+                         "PM2.5 (avg)": base * day, "Category": "Good", "Observations": 1})
+    path = tmp_path / "Hanoi_daily_combined.csv"
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.mark.parametrize("pollutant, expected", [("PM2.5", 45.0), ("PM10", 90.0), ("CO", 0.75)])
+def test_legacy_report_per_pollutant(legacy_report, pollutant, expected, capsys):
+    part = pm.monthly_partial(legacy_report, pollutant=pollutant)
+    assert "Warning" not in capsys.readouterr().err
+    assert part["Value_Count"].tolist() == [2]
+    assert part["Value_Sum"].iloc[0] / part["Value_Count"].iloc[0] == pytest.approx(expected)
+
+
+def test_short_alias_is_not_substring_matched(tmp_path):
+    path = tmp_path / "station.csv"
+    pd.DataFrame({"Date": ["2023-01-01", "2023-01-02"], "Country": ["VN", "VN"], "co": [1.0, 3.0]}).to_csv(path, index=False)
+    part = pm.monthly_partial(str(path), pollutant="CO")
+    assert part["Value_Sum"].tolist() == [4.0]
@@ -0,0 +1,55 @@
+"""Sketch building, merging and serialization tests for sketches.py (run with pytest from scripts/)."""
+import numpy as np
+import pytest
+
+from combine_daily import merge_partials, partial_aggregate
+from sketches import DDSketch, build_sketches, load_table, merge_tables, quantile_frame, save_table
+from test_combine_daily import hourly_rows
+
+
+def test_sketches_count_hourly_means_not_readings():
+    # hour 0 has three readings split across two files; hour 1 has one
+    first = hourly_rows([("Hanoi", "PM2.5 - Principal", 1, 0, 10.0), ("Hanoi", "PM2.5 - Principal", 1, 0, 20.0)])
+    second = hourly_rows([("Hanoi", "PM2.5 - Principal", 1, 0, 30.0), ("Hanoi", "PM2.5 - Principal", 1, 1, 50.0),
+                          ("Hanoi", "O3", 1, 0, 0.0)])
+    partial = merge_partials([partial_aggregate(first), partial_aggregate(second)])
+    table = build_sketches(partial)
+
+    assert set(table) == {("Hanoi", "PM2.5", 2023, 1), ("Hanoi", "O3", 2023, 1)}
+    pm = table[("Hanoi", "PM2.5", 2023, 1)]
+    assert pm.count == 2
+    assert pm.sum == pytest.approx(20.0 + 50.0)
+    assert pm.quantiles([0.0, 1.0]) == pytest.approx([20.0, 50.0], rel=0.01)
+    assert table[("Hanoi", "O3", 2023, 1)].count == 1  # zero readings are counted, not bucketed
+
+    frame = quantile_frame(table, ["Site", "Pollutant"]).set_index("Pollutant")
+    assert frame.loc["PM2.5", "Hours"] == 2
+    assert frame.loc["PM2.5", "Mean"] == 35.0
+
+
+def test_merged_sketch_matches_single_pass():
+    values = np.random.default_rng(1).lognormal(np.log(30), 0.7, 5000)
+    whole = DDSketch().add_many(values)
+    parts = [DDSketch().add_many(chunk) for chunk in np.array_split(values, 4)]
+    merged = merge_tables([{("Hanoi", "PM2.5", 2023, 1): p} for p in parts])[("Hanoi", "PM2.5", 2023, 1)]
+
+    assert merged.bins == whole.bins
+    assert merged.count == whole.count == 5000
+    assert parts[0].count == 1250  # inputs are left untouched
+    exact = np.quantile(values, [0.5, 0.95, 0.99])
+    assert np.allclose(merged.quantiles([0.5, 0.95, 0.99]), exact, rtol=0.02)
+
+
+def test_table_round_trip(tmp_path):
+    table = {("Hanoi", "PM2.5", 2023, 1): DDSketch().add_many([0.0, 5.0, 12.5, 80.0]),
+             ("Manila", "CO", 2023, 2): DDSketch().add_many([0.4, 0.9])}
+    path = str(tmp_path / "sketches.csv")
+    save_table(table, path)
+    loaded = load_table(path)
+
+    assert set(loaded) == set(table)
+    for key, sketch in table.items():
+        again = loaded[key]
+        assert again.bins == sketch.bins
+        assert (again.count, again.sum, again.min, again.max) == (sketch.count, sketch.sum, sketch.min, sketch.max)
+        assert DDSketch.from_string(sketch.to_string()).quantiles([0.5]) == sketch.quantiles([0.5])